@@ -1,8 +1,15 @@
+from __future__ import annotations
+
+import io
 import re
-import math
-import pandas as pd
+from typing import TYPE_CHECKING
+
+import numpy as np
 import streamlit as st
-import matplotlib.pyplot as plt
+
+# pandas / matplotlib are imported where used so pages that don't need them skip the import cost
+if TYPE_CHECKING:
+    import pandas as pd
 
 st.set_page_config(page_title="Lab-ready His-tag Toolkit", layout="wide")
 
@@ -19,68 +26,100 @@ AA_RESIDUE_MW = {
 }
 H2O = 18.015  # Da
 
+# FASTA header lines (">..."); line starts follow the same separators str.splitlines() uses
+_LINE_SEP = r"\n\r\v\f\x1c-\x1e\x85\u2028\u2029"
+_FASTA_HDR_RE = re.compile(rf"(?:\A|(?<=[{_LINE_SEP}]))[^\S{_LINE_SEP}]*>[^{_LINE_SEP}]*")
+# Every byte that is not a canonical residue letter; stripped in one bytes.translate pass
+_NON_AA_BYTES = bytes(b for b in range(256) if chr(b) not in AA_RESIDUE_MW)
+
+# Residue mass in integer mDa indexed by ASCII code; MW = residue histogram · mass table.
+# Integer sums are exact, so the .xx5 tie (from H2O's third decimal) rounds the same way every time.
+_MW_MDA = np.zeros(256, dtype=np.int64)
+for _aa, _mw in AA_RESIDUE_MW.items():
+    _MW_MDA[ord(_aa)] = round(_mw * 1000)
+_H2O_MDA = round(H2O * 1000)
 
+
+@st.cache_data(show_spinner=False, max_entries=64)
 def clean_sequence(raw: str) -> str:
     """Accept FASTA or raw. Remove headers and keep only valid AA letters."""
     if not raw:
         return ""
-    lines = []
-    for line in raw.splitlines():
-        if line.strip().startswith(">"):
-            continue
-        lines.append(line)
-    seq = "".join(lines).upper()
-    seq = re.sub(r"[^A-Z]", "", seq)
-    seq = "".join([aa for aa in seq if aa in AA_RESIDUE_MW])
-    return seq
+    seq = _FASTA_HDR_RE.sub("", raw).upper()
+    return seq.encode("ascii", "ignore").translate(None, _NON_AA_BYTES).decode("ascii")
+
+
+def _seq_buf(seq: str) -> np.ndarray:
+    return np.frombuffer(seq.encode("ascii"), dtype=np.uint8)
+
 
+def _mw_from_buf(buf: np.ndarray) -> float:
+    mda = int(np.bincount(buf, minlength=256) @ _MW_MDA) + _H2O_MDA
+    # round half up to 0.01 Da
+    return ((mda + 5) // 10) / 100
 
+
+def _his_runs_from_buf(buf: np.ndarray, min_len: int) -> list[tuple[int, int]]:
+    # +1 / -1 edges of the H mask mark run starts / ends
+    edges = np.diff(np.concatenate(([False], buf == ord("H"), [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts) >= min_len
+    return [(int(a), int(b)) for a, b in zip(starts[keep], ends[keep])]
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
 def calc_mw_da(seq: str) -> float:
     """Residue sum + H2O(termini)"""
     if not seq:
         return 0.0
-    mw = sum(AA_RESIDUE_MW[aa] for aa in seq) + H2O
-    return round(mw, 2)
+    return _mw_from_buf(_seq_buf(seq))
 
 
-def find_his_runs(seq: str, min_len: int = 6):
-    return [(m.start(), m.end()) for m in re.finditer(rf"H{{{min_len},}}", seq)]
+@st.cache_data(show_spinner=False, max_entries=64)
+def scan_sequence(seq: str, min_his: int = 6) -> tuple[float, int, list[tuple[int, int]]]:
+    """MW, length and His-runs from one encoded buffer (cleaned seq only)."""
+    if not seq:
+        return 0.0, 0, []
+    buf = _seq_buf(seq)
+    return _mw_from_buf(buf), buf.size, _his_runs_from_buf(buf, min_his)
 
 
-def c1v1_ml(final_vol_ml: float, final_conc, stock_conc) -> float:
-    """C1V1=C2V2; units must match. Returns mL."""
-    if stock_conc == 0:
-        return 0.0
-    return (final_conc * final_vol_ml) / stock_conc
+def c1v1_ml_vec(final_vol_ml: float, final_conc: np.ndarray, stock_conc: np.ndarray) -> np.ndarray:
+    """C1V1=C2V2 for many components at once; units must match per pair (mM, %, ×). Returns mL, 0 where stock is 0."""
+    final_conc = np.asarray(final_conc, dtype=np.float64)
+    stock_conc = np.asarray(stock_conc, dtype=np.float64)
+    out = np.zeros_like(final_conc)
+    return np.divide(final_conc * final_vol_ml, stock_conc, out=out, where=stock_conc != 0)
 
 
-def pct_vv_ml(final_vol_ml: float, final_pct: float, stock_pct: float) -> float:
-    """v/v percent from percent stock. Returns mL."""
-    if stock_pct == 0:
-        return 0.0
-    return (final_pct / stock_pct) * final_vol_ml
-
-
-def recipe_df(final_vol_ml: float, rows: list[dict]) -> pd.DataFrame:
-    used = sum(float(r["vol_ml"]) for r in rows)
-    dw = max(0.0, float(final_vol_ml) - used)
-    out_rows = []
-    for r in rows:
-        out_rows.append({
-            "Component": r["Component"],
-            "Stock": r.get("Stock", "-"),
-            "Target (final)": r.get("Target (final)", "-"),
-            "Volume (mL)": float(r["vol_ml"])
-        })
-    out_rows.append({"Component": "DW", "Stock": "-", "Target (final)": "to volume", "Volume (mL)": dw})
-    df = pd.DataFrame(out_rows)
-    df["Volume (mL)"] = df["Volume (mL)"].map(lambda x: round(x, 4))
-    return df
+def recipe_df(final_vol_ml: float, names: tuple[str, ...], stocks: tuple[str, ...], targets: tuple[str, ...],
+              vols: np.ndarray) -> pd.DataFrame:
+    import pandas as pd
+
+    dw = max(0.0, float(final_vol_ml) - float(vols.sum()))
+    return pd.DataFrame({
+        "Component": [*names, "DW"],
+        "Stock": [*stocks, "-"],
+        "Target (final)": [*targets, "to volume"],
+        "Volume (mL)": np.append(vols, dw).round(4),
+    })
+
+
+def component_recipe_df(final_vol_ml: float, components: list[tuple]) -> pd.DataFrame:
+    """components: (name, stock label, target label, final conc, stock conc)."""
+    names, stocks, targets, final_conc, stock_conc = zip(*components)
+    vols = c1v1_ml_vec(final_vol_ml, final_conc, stock_conc)
+    return recipe_df(final_vol_ml, names, stocks, targets, vols)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _df_to_csv_bytes(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
 
 
 def download_df_button(df: pd.DataFrame, filename: str, label: str):
-    csv = df.to_csv(index=False).encode("utf-8")
-    st.download_button(label=label, data=csv, file_name=filename, mime="text/csv")
+    st.download_button(label=label, data=_df_to_csv_bytes(df), file_name=filename, mime="text/csv")
 
 
 # ==============================
@@ -135,15 +174,14 @@ def page_protein_mw():
             st.info("서열을 입력하면 MW가 계산됩니다.")
             return
 
-        mw_da = calc_mw_da(seq_calc)
+        mw_da, seq_len, runs = scan_sequence(seq_calc, 6)
         mw_kda = mw_da / 1000.0
 
         st.metric("Molecular Weight", f"{mw_da:,.2f} Da", f"{mw_kda:,.3f} kDa")
         if show_len:
-            st.write(f"Length: **{len(seq_calc)} aa**")
+            st.write(f"Length: **{seq_len} aa**")
 
         if detect_his:
-            runs = find_his_runs(seq_calc, 6)
             if runs:
                 st.success(f"His-run(≥6) 탐지: {len(runs)}개 | 위치(0-index): {runs}")
             else:
@@ -249,62 +287,31 @@ def page_buffer_designer():
     if st.button("✅ Calculate buffer recipes", type="primary"):
         base_stock_mM = base_options[base_stock_name]
 
+        base = ("Base buffer", base_stock_name, f"{base_final_mM} mM", base_final_mM, base_stock_mM)
+        nacl = ("NaCl", f"{nacl_stock_mM/1000:.1f} M", f"{nacl_final_mM} mM", nacl_final_mM, nacl_stock_mM)
+
+        def imidazole(final_mM):
+            return ("Imidazole", f"{imid_stock_mM/1000:.1f} M", f"{final_mM} mM", final_mM, imid_stock_mM)
+
         # Lysis
-        l_rows = []
-        l_rows.append({"Component": "Base buffer", "Stock": base_stock_name,
-                       "Target (final)": f"{base_final_mM} mM",
-                       "vol_ml": c1v1_ml(lysis_vol, base_final_mM, base_stock_mM)})
-        l_rows.append({"Component": "NaCl", "Stock": f"{nacl_stock_mM/1000:.1f} M",
-                       "Target (final)": f"{nacl_final_mM} mM",
-                       "vol_ml": c1v1_ml(lysis_vol, nacl_final_mM, nacl_stock_mM)})
+        l_comps = [base, nacl]
         if tx_final_pct > 0:
-            l_rows.append({"Component": "Triton X-100", "Stock": f"{tx_stock_pct}%",
-                           "Target (final)": f"{tx_final_pct}%",
-                           "vol_ml": pct_vv_ml(lysis_vol, tx_final_pct, tx_stock_pct)})
+            l_comps.append(("Triton X-100", f"{tx_stock_pct}%", f"{tx_final_pct}%", tx_final_pct, tx_stock_pct))
         if pi_final_x > 0:
-            l_rows.append({"Component": "Protease inhibitor", "Stock": f"{pi_stock_x}×",
-                           "Target (final)": f"{pi_final_x}×",
-                           "vol_ml": (pi_final_x / pi_stock_x) * lysis_vol})
+            l_comps.append(("Protease inhibitor", f"{pi_stock_x}×", f"{pi_final_x}×", pi_final_x, pi_stock_x))
         if imid_lysis_mM > 0:
-            l_rows.append({"Component": "Imidazole", "Stock": f"{imid_stock_mM/1000:.1f} M",
-                           "Target (final)": f"{imid_lysis_mM} mM",
-                           "vol_ml": c1v1_ml(lysis_vol, imid_lysis_mM, imid_stock_mM)})
+            l_comps.append(imidazole(imid_lysis_mM))
         if add_dtt and dtt_final_mM > 0:
-            l_rows.append({"Component": "DTT", "Stock": f"{dtt_stock_mM/1000:.1f} M",
-                           "Target (final)": f"{dtt_final_mM} mM",
-                           "vol_ml": c1v1_ml(lysis_vol, dtt_final_mM, dtt_stock_mM)})
+            l_comps.append(("DTT", f"{dtt_stock_mM/1000:.1f} M", f"{dtt_final_mM} mM", dtt_final_mM, dtt_stock_mM))
         if add_bme and bme_final_mM > 0:
-            l_rows.append({"Component": "β-ME", "Stock": "14.3 M",
-                           "Target (final)": f"{bme_final_mM} mM",
-                           "vol_ml": c1v1_ml(lysis_vol, bme_final_mM, bme_stock_mM)})
-
-        lysis_df = recipe_df(lysis_vol, l_rows)
+            l_comps.append(("β-ME", "14.3 M", f"{bme_final_mM} mM", bme_final_mM, bme_stock_mM))
+        lysis_df = component_recipe_df(lysis_vol, l_comps)
 
         # Wash
-        w_rows = []
-        w_rows.append({"Component": "Base buffer", "Stock": base_stock_name,
-                       "Target (final)": f"{base_final_mM} mM",
-                       "vol_ml": c1v1_ml(wash_vol, base_final_mM, base_stock_mM)})
-        w_rows.append({"Component": "NaCl", "Stock": f"{nacl_stock_mM/1000:.1f} M",
-                       "Target (final)": f"{nacl_final_mM} mM",
-                       "vol_ml": c1v1_ml(wash_vol, nacl_final_mM, nacl_stock_mM)})
-        w_rows.append({"Component": "Imidazole", "Stock": f"{imid_stock_mM/1000:.1f} M",
-                       "Target (final)": f"{imid_wash_mM} mM",
-                       "vol_ml": c1v1_ml(wash_vol, imid_wash_mM, imid_stock_mM)})
-        wash_df = recipe_df(wash_vol, w_rows)
+        wash_df = component_recipe_df(wash_vol, [base, nacl, imidazole(imid_wash_mM)])
 
         # Elution
-        e_rows = []
-        e_rows.append({"Component": "Base buffer", "Stock": base_stock_name,
-                       "Target (final)": f"{base_final_mM} mM",
-                       "vol_ml": c1v1_ml(elution_vol, base_final_mM, base_stock_mM)})
-        e_rows.append({"Component": "NaCl", "Stock": f"{nacl_stock_mM/1000:.1f} M",
-                       "Target (final)": f"{nacl_final_mM} mM",
-                       "vol_ml": c1v1_ml(elution_vol, nacl_final_mM, nacl_stock_mM)})
-        e_rows.append({"Component": "Imidazole", "Stock": f"{imid_stock_mM/1000:.1f} M",
-                       "Target (final)": f"{imid_elution_mM} mM",
-                       "vol_ml": c1v1_ml(elution_vol, imid_elution_mM, imid_stock_mM)})
-        elution_df = recipe_df(elution_vol, e_rows)
+        elution_df = component_recipe_df(elution_vol, [base, nacl, imidazole(imid_elution_mM)])
 
         st.success("Buffer recipes calculated.")
 
@@ -425,34 +432,38 @@ def page_sop():
 # Page 4: Virtual SDS-PAGE
 # ==============================
 
-def _mw_to_migration(mw_kda: float, gel_system: str, gel_pct: float) -> float:
-    """Simple log mapping + gel% effect (higher % -> smaller proteins run further). Returns 0~1."""
-    # base ranges
-    if gel_system == "Tris-Glycine":
-        hi, lo = 250.0, 10.0
-    else:  # Tricine
-        hi, lo = 100.0, 1.0
+# Marker ladders (kDa), top to bottom
+_LADDERS = {
+    "10–250 kDa ladder": (250, 150, 100, 75, 50, 37, 25, 20, 15, 10),
+    "5–100 kDa ladder": (100, 75, 50, 37, 25, 20, 15, 10, 5),
+    "2–40 kDa ladder": (40, 30, 25, 20, 15, 10, 5, 2),
+}
 
-    mw_kda = min(max(mw_kda, lo), hi)
+# Per gel system: (hi, lo, log10(hi), log10(hi) - log10(lo)); MW range in kDa
+_GEL_PARAMS = {
+    name: (hi, lo, float(np.log10(hi)), float(np.log10(hi) - np.log10(lo)))
+    for name, (hi, lo) in {"Tris-Glycine": (250.0, 10.0), "Tricine": (100.0, 1.0)}.items()
+}
+
+
+def _mw_to_migration_vec(mws: np.ndarray, gel_system: str, gel_pct: float) -> np.ndarray:
+    """Simple log mapping + gel% effect (higher % -> smaller proteins run further). Returns 0~1 per band."""
+    hi, lo, log_hi, log_span = _GEL_PARAMS[gel_system]
+
+    # clip allocates the one output buffer; every later step runs in place on it
+    y = np.clip(np.asarray(mws, dtype=np.float64), lo, hi)
 
     # log distance (0 top, 1 bottom)
-    base = (math.log10(hi) - math.log10(mw_kda)) / (math.log10(hi) - math.log10(lo))
+    np.log10(y, out=y)
+    np.subtract(log_hi, y, out=y)
+    y /= log_span
 
     # gel% tweak: relative to 12%
     # higher %: pushes small proteins further down (increase base a bit)
-    pct_effect = (gel_pct - 12.0) * 0.015
+    y += (gel_pct - 12.0) * 0.015
 
     # keep within 0~1
-    y = base + pct_effect
-    return min(max(y, 0.02), 0.98)
-
-
-def _default_ladders():
-    return {
-        "10–250 kDa ladder": [250, 150, 100, 75, 50, 37, 25, 20, 15, 10],
-        "5–100 kDa ladder": [100, 75, 50, 37, 25, 20, 15, 10, 5],
-        "2–40 kDa ladder": [40, 30, 25, 20, 15, 10, 5, 2],
-    }
+    return np.clip(y, 0.02, 0.98, out=y)
 
 
 def _recommend_gel(mw_kda: float):
@@ -466,6 +477,45 @@ def _recommend_gel(mw_kda: float):
     return "Tris-Glycine", 10.0
 
 
+@st.cache_resource(show_spinner=False)
+def _pyplot():
+    """Lazy pyplot import, resolved once per server process."""
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _sds_png(gel_system: str, gel_pct: float, ladder: tuple, lane_count: int, mw_kda: float) -> bytes:
+    """Render the virtual gel to PNG bytes; the figure is closed so nothing mutable is shared or leaked."""
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(5.6, 7.6))
+    ax.set_xlim(0, lane_count)
+    ax.set_ylim(1, 0)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.set_title(f"Virtual SDS-PAGE ({gel_system}, {gel_pct}%)")
+
+    # lanes background
+    ax.vlines(np.arange(lane_count) + 0.5, 0.02, 0.98, colors="C0", linewidth=6, alpha=0.06)
+
+    # ladder lane (0) + target lane (1): one migration call, target is the last entry
+    ys = _mw_to_migration_vec(np.array(ladder + (mw_kda,), dtype=np.float64), gel_system, gel_pct)
+    ax.hlines(ys[:-1], 0.35, 0.65, colors="C0", linewidth=2)
+    for mw, y in zip(ladder, ys[:-1]):
+        ax.text(0.68, y, f"{mw}k", fontsize=8, va="center")
+
+    y_target = ys[-1]
+    ax.hlines(y_target, 1.35, 1.65, colors="C3", linewidth=3)
+    ax.text(1.7, y_target, f"Target ~{mw_kda:.2f}k", fontsize=9, va="center")
+
+    # same output settings st.pyplot uses
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=200, bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+
 def page_virtual_sds():
     st.title("🧫 Virtual SDS-PAGE (Band Predictor)")
     st.caption("예상 MW 기반으로 밴드 위치를 사전 예측하고, gel%/marker 선택 근거를 확보합니다.")
@@ -491,8 +541,7 @@ def page_virtual_sds():
         st.metric("Predicted MW", f"{mw_kda:.3f} kDa")
 
     with right:
-        ladders = _default_ladders()
-        ladder_name = st.selectbox("Marker ladder", list(ladders.keys()), index=1)
+        ladder_name = st.selectbox("Marker ladder", list(_LADDERS.keys()), index=1)
 
         # gel system + gel%
         auto_gel = st.checkbox("MW 기반 gel 추천값 자동 적용", value=True)
@@ -511,31 +560,9 @@ def page_virtual_sds():
     if mw_kda < 10 and gel_system != "Tricine":
         st.warning("10 kDa 미만이면 Tricine gel이 밴드 분리/식별에 유리합니다.")
 
-    # Plot
-    fig, ax = plt.subplots(figsize=(5.6, 7.6))
-    ax.set_xlim(0, lane_count)
-    ax.set_ylim(1, 0)
-    ax.set_xticks([])
-    ax.set_yticks([])
-    ax.set_title(f"Virtual SDS-PAGE ({gel_system}, {gel_pct}%)")
-
-    # lanes background
-    for i in range(lane_count):
-        ax.plot([i + 0.5, i + 0.5], [0.02, 0.98], linewidth=6, alpha=0.06)
-
-    # ladder lane (0)
-    ladder = ladders[ladder_name]
-    for mw in ladder:
-        y = _mw_to_migration(float(mw), gel_system, float(gel_pct))
-        ax.plot([0.35, 0.65], [y, y], linewidth=2)
-        ax.text(0.68, y, f"{mw}k", fontsize=8, va="center")
-
-    # target lane (1)
-    y_target = _mw_to_migration(float(mw_kda), gel_system, float(gel_pct))
-    ax.plot([1.35, 1.65], [y_target, y_target], linewidth=3)
-    ax.text(1.7, y_target, f"Target ~{mw_kda:.2f}k", fontsize=9, va="center")
-
-    st.pyplot(fig)
+    # Plot (cached per view; MW rounded to the label precision for better hit rate)
+    png = _sds_png(gel_system, float(gel_pct), _LADDERS[ladder_name], lane_count, round(float(mw_kda), 2))
+    st.image(png, use_container_width=True)
 
     st.divider()
     st.subheader("로딩/마커 선택 근거 (실험용)")